@@ -3,19 +3,38 @@
 Compressor Research Script
 Compresses GameAsset.txt, LargeDataset.txt, and sample_files.txt using multiple algorithms
 """
+import argparse
 import gzip
 import bz2
+import hashlib
+import json
 import lzma
+import mmap
 import os
+import shutil
+import sys
 import time
 import psutil
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 
+# resource is Unix-only; without it worker memory isn't reported
+try:
+    import resource
+except ImportError:
+    resource = None
+
 # Optional compression libraries
 OPTIONAL_LIBS = {}
 try:
     import zstandard as zstd
     OPTIONAL_LIBS['zstd'] = zstd
+    # Shared contexts keyed by (level, dict id, thread count) and dict id, reused
+    # for every file instead of reallocating the window and hash tables per call
+    _ZSTD_CCTX = {}
+    _ZSTD_DCTX = {}
 except ImportError:
     pass
 
@@ -25,87 +44,569 @@ try:
 except ImportError:
     pass
 
-def compress_with_gzip(input_file, output_file):
+try:
+    import xxhash
+    OPTIONAL_LIBS['xxhash'] = xxhash
+except ImportError:
+    pass
+
+try:
+    import cupy
+    import kvikio
+    from nvidia import nvcomp
+    OPTIONAL_LIBS['nvcomp'] = nvcomp
+    # What CUDA, kvikio and nvCOMP raise when the GPU can't do the job
+    _GPU_ERRORS = (RuntimeError, cupy.cuda.memory.OutOfMemoryError)
+except ImportError:
+    pass
+
+# Feed compressors fixed 1 MiB blocks rather than one line at a time
+COPY_CHUNK_SIZE = 1024 * 1024
+# File buffer size, much larger than io.DEFAULT_BUFFER_SIZE (8 KiB)
+BUFFER_SIZE = 4 * 1024 * 1024
+# Inputs at least this large go to the GPU when nvCOMP is available; below
+# it the PCIe transfer setup costs more than it saves
+GPU_MIN_SIZE = 64 * 1024 * 1024
+# Largest chunk nvCOMP compresses into a single zstd frame
+GPU_CHUNK_SIZE = 16 * 1024 * 1024
+# Chunks compressed together in one nvCOMP batch, about 256 MiB of input on
+# the device at a time
+GPU_BATCH_CHUNKS = 16
+
+# Inputs below this size are mapped and compressed in one call instead of
+# streamed. Each job holds its whole compressed output in memory, so this
+# caps one-shot memory at about 32 MiB per pool worker
+ONE_SHOT_MAX_SIZE = 32 * 1024 * 1024
+
+# Compression level used for each algorithm unless overridden
+DEFAULT_LEVELS = {'gzip': 9, 'bzip2': 9, 'xz': 6, 'zstd': 3, 'lz4': 3}
+
+# zstd dictionaries trained on the inputs are saved in the output directory
+# under their dict id and never overwritten, so older outputs stay decodable
+ZSTD_DICT_FILE = '.zstd_dict.{}.bin'
+ZSTD_DICT_SIZE = 64 * 1024
+# Training samples are cut from the first ZSTD_SAMPLE_BYTES of each input
+ZSTD_SAMPLE_SIZE = 4096
+ZSTD_SAMPLE_BYTES = 1024 * 1024
+# Largest possible zstd frame header (ZSTD_FRAMEHEADERSIZE_MAX)
+ZSTD_FRAME_HEADER_MAX = 18
+# zstd worker threads per compressor. -1 uses every core; compress_files
+# lowers it in its pool workers so the pool doesn't oversubscribe the CPU
+ZSTD_THREADS = -1
+
+# Maps (algorithm, level, input hash) to the output already compressed from
+# that content, and each input path to its last hash, kept in the output
+# directory across runs
+COMPRESS_CACHE_FILE = '.compress_cache.json'
+
+def _big_open(path, mode):
+    """Open a file with a large buffer to cut read/write syscalls"""
+    return open(path, mode, buffering=BUFFER_SIZE)
+
+def _hint_seq(f):
+    """Tell the kernel the file will be read once, front to back"""
+    if hasattr(os, 'posix_fadvise'):
+        fd = f.fileno()
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+
+def _drop_cache(path):
+    """Let the kernel drop a file's pages so large inputs don't evict the page cache"""
+    if hasattr(os, 'posix_fadvise'):
+        with open(path, 'rb') as f:
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
+@contextmanager
+def _map_input(path):
+    """Memory-map an input file read-only for a single sequential pass"""
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            yield mm
+
+@contextmanager
+def _open_input(path):
+    """Open an input file for a single sequential pass"""
+    with _big_open(path, 'rb') as f:
+        _hint_seq(f)
+        yield f
+
+def compress_with_gzip(input_file, output_file, level=9):
     """Compress using gzip"""
-    with open(input_file, 'rb') as f_in:
-        with gzip.open(output_file, 'wb') as f_out:
-            f_out.writelines(f_in)
+    with _open_input(input_file) as f_in, _big_open(output_file, 'wb') as f_raw:
+        with gzip.open(f_raw, 'wb', compresslevel=level) as f_out:
+            shutil.copyfileobj(f_in, f_out, length=COPY_CHUNK_SIZE)
 
-def compress_with_bzip2(input_file, output_file):
+def compress_with_bzip2(input_file, output_file, level=9):
     """Compress using bzip2"""
-    with open(input_file, 'rb') as f_in:
-        with bz2.open(output_file, 'wb') as f_out:
-            f_out.writelines(f_in)
+    with _open_input(input_file) as f_in, _big_open(output_file, 'wb') as f_raw:
+        with bz2.open(f_raw, 'wb', compresslevel=level) as f_out:
+            shutil.copyfileobj(f_in, f_out, length=COPY_CHUNK_SIZE)
 
-def compress_with_xz(input_file, output_file):
+def compress_with_xz(input_file, output_file, level=6):
     """Compress using xz (lzma)"""
-    with open(input_file, 'rb') as f_in:
-        with lzma.open(output_file, 'wb') as f_out:
-            f_out.writelines(f_in)
+    with _open_input(input_file) as f_in, _big_open(output_file, 'wb') as f_raw:
+        with lzma.open(f_raw, 'wb', preset=level) as f_out:
+            shutil.copyfileobj(f_in, f_out, length=COPY_CHUNK_SIZE)
 
-def compress_with_zstd(input_file, output_file):
-    """Compress using zstandard"""
+def compress_with_zstd_gpu(input_file, output_file):
+    """Compress using nvCOMP zstd on the GPU
+    
+    Up to GPU_BATCH_CHUNKS chunks are read straight into their own device
+    buffers, compressed as one asynchronous batch and copied back to the host
+    in a single transfer. Each chunk becomes its own zstd frame, so the
+    concatenated output decodes with any zstd tool. nvCOMP has no zstd level
+    setting and no dictionary support.
+    
+    Only checked against stand-in cupy, kvikio and nvCOMP modules that compress
+    on the CPU; it hasn't been run on a GPU.
+    """
+    if 'nvcomp' not in OPTIONAL_LIBS:
+        raise ImportError("nvcomp not available")
+    
+    codec = nvcomp.Codec(algorithm="Zstd",
+                         bitstream_kind=nvcomp.BitstreamKind.RAW,
+                         uncomp_chunk_size=GPU_CHUNK_SIZE)
+    input_size = get_file_size(input_file)
+    batch_size = GPU_CHUNK_SIZE * GPU_BATCH_CHUNKS
+    
+    with kvikio.CuFile(input_file, 'r') as f_in:
+        with _big_open(output_file, 'wb') as f_out:
+            for batch_start in range(0, input_size, batch_size):
+                batch_end = min(batch_start + batch_size, input_size)
+                offsets = range(batch_start, batch_end, GPU_CHUNK_SIZE)
+                chunks = [cupy.empty(min(GPU_CHUNK_SIZE, batch_end - offset),
+                                     dtype=cupy.uint8) for offset in offsets]
+                # Start every read before waiting on any of them
+                reads = [f_in.pread(chunk, file_offset=offset)
+                         for chunk, offset in zip(chunks, offsets)]
+                for read in reads:
+                    read.get()
+                frames = codec.encode([nvcomp.as_array(chunk) for chunk in chunks])
+                # Join the frames on the device so the batch syncs once
+                batch = cupy.concatenate([cupy.asarray(frame) for frame in frames])
+                f_out.write(batch.get())
+
+def _load_zstd_dict(dict_file):
+    """Load a trained zstd dictionary, or None if there isn't one"""
+    if dict_file is None or not Path(dict_file).exists():
+        return None
+    with open(dict_file, 'rb') as f:
+        return zstd.ZstdCompressionDict(f.read())
+
+def _zstd_dict_path(directory, dict_id):
+    """Path of the saved zstd dictionary with this id"""
+    return Path(directory) / ZSTD_DICT_FILE.format(dict_id)
+
+def _train_zstd_dict(paths, output_dir, dict_size=ZSTD_DICT_SIZE):
+    """Train a zstd dictionary on samples of the inputs and return its saved path"""
+    if 'zstd' not in OPTIONAL_LIBS:
+        raise ImportError("zstandard not available")
+    
+    samples = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            data = f.read(ZSTD_SAMPLE_BYTES)
+        samples.extend(data[i:i + ZSTD_SAMPLE_SIZE]
+                       for i in range(0, len(data), ZSTD_SAMPLE_SIZE))
+    
+    trained = zstd.train_dictionary(dict_size, samples)
+    dict_file = _zstd_dict_path(output_dir, trained.dict_id())
+    if not dict_file.exists():
+        with open(dict_file, 'wb') as f:
+            f.write(trained.as_bytes())
+    return dict_file
+
+def _zstd_compressor(level, dict_data=None):
+    """Return the shared ZstdCompressor for this level and dictionary
+    
+    libzstd compresses frames on ZSTD_THREADS worker threads. Each thread keeps
+    its own window, so peak memory grows to roughly threads * window size.
+    """
+    key = (level, dict_data.dict_id() if dict_data else 0, ZSTD_THREADS)
+    if key not in _ZSTD_CCTX:
+        _ZSTD_CCTX[key] = zstd.ZstdCompressor(level=level, threads=ZSTD_THREADS,
+                                              dict_data=dict_data)
+    return _ZSTD_CCTX[key]
+
+def _zstd_decompressor(dict_data=None):
+    """Return the shared ZstdDecompressor for this dictionary"""
+    key = dict_data.dict_id() if dict_data else 0
+    if key not in _ZSTD_DCTX:
+        _ZSTD_DCTX[key] = zstd.ZstdDecompressor(dict_data=dict_data)
+    return _ZSTD_DCTX[key]
+
+def _use_zstd_gpu(input_size):
+    """Check whether nvCOMP is available and an input is large enough for it"""
+    return 'nvcomp' in OPTIONAL_LIBS and input_size >= GPU_MIN_SIZE
+
+def compress_with_zstd(input_file, output_file, level=3, dict_file=None):
+    """Compress using zstandard, with a trained dictionary if dict_file is given
+    
+    The dictionary id is recorded in each frame header, so decompression can
+    tell which dictionary it needs. Returns 'gpu' if nvCOMP made the output,
+    otherwise 'cpu'; the GPU output ignores level.
+    """
+    if 'zstd' not in OPTIONAL_LIBS:
+        raise ImportError("zstandard not available")
+    
+    input_size = get_file_size(input_file)
+    dict_data = _load_zstd_dict(dict_file)
+    if dict_data is None and _use_zstd_gpu(input_size):
+        try:
+            compress_with_zstd_gpu(input_file, output_file)
+            return 'gpu'
+        except _GPU_ERRORS:
+            # No usable GPU, drop the partial output and use the CPU path below
+            Path(output_file).unlink(missing_ok=True)
+    
+    cctx = _zstd_compressor(level, dict_data)
+    # With a dictionary the one-shot frames come out larger, so stream instead
+    if dict_data is None and 0 < input_size < ONE_SHOT_MAX_SIZE:
+        # One C call over the whole mapping lets the worker threads split it
+        with _map_input(input_file) as mm, _big_open(output_file, 'wb') as f_out:
+            f_out.write(cctx.compress(mm))
+        return 'cpu'
+    
+    with _open_input(input_file) as f_in:
+        with _big_open(output_file, 'wb') as f_out:
+            cctx.copy_stream(f_in, f_out,
+                             read_size=COPY_CHUNK_SIZE,
+                             write_size=COPY_CHUNK_SIZE)
+    return 'cpu'
+
+def decompress_with_zstd(input_file, output_file, dict_dir=None):
+    """Decompress a zstandard file
+    
+    If its frames were compressed with a dictionary, the dictionary named by
+    the frame's dict id is loaded from dict_dir (default: the input's directory).
+    """
     if 'zstd' not in OPTIONAL_LIBS:
         raise ImportError("zstandard not available")
     
-    cctx = OPTIONAL_LIBS['zstd'].ZstdCompressor()
-    with open(input_file, 'rb') as f_in:
-        with open(output_file, 'wb') as f_out:
-            cctx.copy_stream(f_in, f_out)
+    with _open_input(input_file) as f_in:
+        header = f_in.peek(ZSTD_FRAME_HEADER_MAX)
+        dict_id = zstd.get_frame_parameters(header).dict_id
+        dict_data = None
+        if dict_id != 0:
+            dict_file = _zstd_dict_path(dict_dir or Path(input_file).parent, dict_id)
+            with open(dict_file, 'rb') as f:
+                dict_data = zstd.ZstdCompressionDict(f.read())
+        dctx = _zstd_decompressor(dict_data)
+        with _big_open(output_file, 'wb') as f_out:
+            dctx.copy_stream(f_in, f_out,
+                             read_size=COPY_CHUNK_SIZE,
+                             write_size=COPY_CHUNK_SIZE)
 
-def compress_with_lz4(input_file, output_file):
+def compress_with_lz4(input_file, output_file, level=3):
     """Compress using lz4"""
     if 'lz4' not in OPTIONAL_LIBS:
         raise ImportError("lz4 not available")
     
-    with open(input_file, 'rb') as f_in:
-        with open(output_file, 'wb') as f_out:
-            OPTIONAL_LIBS['lz4'].compress_stream(f_in, f_out)
+    if 0 < get_file_size(input_file) < ONE_SHOT_MAX_SIZE:
+        with _map_input(input_file) as mm, _big_open(output_file, 'wb') as f_out:
+            f_out.write(OPTIONAL_LIBS['lz4'].compress(mm, compression_level=level))
+        return
+    
+    with _open_input(input_file) as f_in, _big_open(output_file, 'wb') as f_raw:
+        with OPTIONAL_LIBS['lz4'].open(f_raw, 'wb', compression_level=level) as f_out:
+            shutil.copyfileobj(f_in, f_out, length=COPY_CHUNK_SIZE)
 
-def compress_file(input_file, output_dir=".venv"):
-    """Compress a single file using all available algorithms"""
+# Algorithm name -> (extension, compress function), in display order
+ALGORITHMS = {
+    'gzip': ('.gz', compress_with_gzip),
+    'bzip2': ('.bz2', compress_with_bzip2),
+    'xz': ('.xz', compress_with_xz),
+    'zstd': ('.zst', compress_with_zstd),
+    'lz4': ('.lz4', compress_with_lz4)
+}
+
+def file_hash(path, buf_size=COPY_CHUNK_SIZE):
+    """Hash a file's contents with xxh3 if available, else blake2b"""
+    if 'xxhash' in OPTIONAL_LIBS:
+        h = xxhash.xxh3_64()
+    else:
+        h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(buf_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _load_cache(cache_file):
+    """Load the output cache, or an empty one if missing or unreadable"""
+    try:
+        with open(cache_file) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def _save_cache(cache_file, cache):
+    """Write the output cache back to disk"""
+    with open(cache_file, 'w') as f:
+        json.dump(cache, f, indent=2)
+
+def _input_digest(input_file, cache, force=False):
+    """Hash an input, reusing its cached digest while its size and mtime match"""
+    file_stat = os.stat(input_file)
+    key = f"input:{os.path.abspath(input_file)}"
+    entry = cache.get(key)
+    if (not force and entry is not None
+            and entry['size'] == file_stat.st_size
+            and entry['mtime_ns'] == file_stat.st_mtime_ns):
+        return entry['digest']
+    digest = file_hash(input_file)
+    cache[key] = {'size': file_stat.st_size, 'mtime_ns': file_stat.st_mtime_ns,
+                  'digest': digest}
+    return digest
+
+def _cache_entry(output_file, elapsed):
+    """Record an output file with its size, mtime and the time it took to make"""
+    file_stat = os.stat(output_file)
+    return {'file': os.path.abspath(output_file), 'size': file_stat.st_size,
+            'mtime_ns': file_stat.st_mtime_ns, 'time': elapsed}
+
+def _cache_hit(entry):
+    """Check whether a cached output still exists unchanged"""
+    if entry is None or 'time' not in entry:
+        return False
+    try:
+        file_stat = os.stat(entry['file'])
+    except FileNotFoundError:
+        return False
+    return (file_stat.st_size == entry['size']
+            and file_stat.st_mtime_ns == entry['mtime_ns'])
+
+def _cached_result(output_file, compression_time):
+    """Build the result dict for an output reused instead of compressed
+    
+    The reported time is the one measured when the output was first made.
+    """
+    return {
+        'success': True,
+        'file': str(output_file),
+        'size': get_file_size(output_file),
+        'time': compression_time,
+        'cached': True
+    }
+
+def _cache_key(algo_name, level, digest, dict_id=0, gpu=False):
+    """Cache key describing exactly how an output's bytes were produced"""
+    if gpu:
+        # nvCOMP output depends on neither level nor dictionary
+        return f"{algo_name}-gpu:{digest}"
+    key = f"{algo_name}:{level}:{digest}"
+    if algo_name == 'zstd':
+        key += f":{dict_id}"
+    return key
+
+def _output_path(input_file, algo_name, output_dir):
+    """Path of the compressed output for one file and algorithm"""
+    extension, _ = ALGORITHMS[algo_name]
+    return Path(output_dir) / f"{Path(input_file).name}{extension}"
+
+def _peak_rss():
+    """Peak RSS in bytes of this process so far, or None without resource"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def _run_one(input_file, algo_name, level, output_dir, dict_file=None):
+    """Compress one file with one algorithm and return its result dict"""
+    _, compress_func = ALGORITHMS[algo_name]
+    output_file = _output_path(input_file, algo_name, output_dir)
+    
+    options = {}
+    if algo_name == 'zstd':
+        options['dict_file'] = dict_file
+    
+    try:
+        t0 = time.perf_counter_ns()
+        backend = compress_func(input_file, output_file, level, **options)
+        compression_time = (time.perf_counter_ns() - t0) / 1e9
+        
+        compressed_size = get_file_size(output_file)
+        return {
+            'success': True,
+            'file': str(output_file),
+            'size': compressed_size,
+            'time': compression_time,
+            'backend': backend or 'cpu',
+            'peak_memory': _peak_rss()
+        }
+    except ImportError:
+        return {
+            'success': False,
+            'error': 'Library not installed'
+        }
+    except Exception as e:
+        return {
+            'success': False,
+            'error': str(e)
+        }
+
+def _init_worker(zstd_threads):
+    """Set up a pool worker process with its share of the zstd threads"""
+    global ZSTD_THREADS
+    ZSTD_THREADS = zstd_threads
+
+def _run_one_star(job):
+    """Unpack a (input_file, algo_name, level, output_dir, dict_file) job for executor.map"""
+    return _run_one(*job)
+
+def compress_files(input_files, output_dir=".venv", levels=None, train_dict=True,
+                   force=False):
+    """Compress several files with all algorithms in parallel worker processes
+    
+    levels overrides DEFAULT_LEVELS per algorithm. With nvCOMP available,
+    inputs of at least GPU_MIN_SIZE are compressed with zstd on the GPU,
+    which takes no dictionary. With train_dict, a zstd dictionary is trained
+    on the remaining inputs first and used for their zstd jobs; those results
+    carry the time training took in 'dict_time'.
+    
+    Inputs are hashed first, unless their size and mtime match the last run.
+    Content already compressed at the same algorithm and level, earlier in
+    this run or in a previous one, is copied from that output instead of being
+    compressed again. force rehashes every input and skips the previous-run
+    outputs but still deduplicates within the run.
+    """
     # Create output directory if it doesn't exist
     Path(output_dir).mkdir(exist_ok=True)
+    levels = {**DEFAULT_LEVELS, **(levels or {})}
     
-    algorithms = [
-        ('gzip', '.gz', compress_with_gzip),
-        ('bzip2', '.bz2', compress_with_bzip2),
-        ('xz', '.xz', compress_with_xz),
-        ('zstd', '.zst', compress_with_zstd),
-        ('lz4', '.lz4', compress_with_lz4)
-    ]
+    cache_file = Path(output_dir) / COMPRESS_CACHE_FILE
+    cache = _load_cache(cache_file)
+    hashes = {input_file: _input_digest(input_file, cache, force)
+              for input_file in input_files}
     
-    results = {}
-    base_name = Path(input_file).name
+    # A dictionary only pays off on small inputs, and nvCOMP can't use one, so
+    # inputs going to the GPU are left out of training
+    gpu_inputs = {input_file for input_file in input_files
+                  if _use_zstd_gpu(get_file_size(input_file))}
+    dict_inputs = [input_file for input_file in input_files
+                   if input_file not in gpu_inputs]
     
-    for algo_name, extension, compress_func in algorithms:
-        output_file = Path(output_dir) / f"{base_name}{extension}"
-        
-        try:
-            start_time = time.time()
-            compress_func(input_file, output_file)
-            compression_time = time.time() - start_time
+    # The dictionary trained on this exact set of inputs is cached like any output
+    dict_file = None
+    dict_id = 0
+    dict_time = 0
+    if train_dict and dict_inputs and 'zstd' in OPTIONAL_LIBS:
+        dict_key = "zstd_dict:" + hashlib.blake2b(
+            "".join(sorted(hashes[input_file] for input_file in dict_inputs)).encode(),
+            digest_size=16).hexdigest()
+        if _cache_hit(cache.get(dict_key)):
+            dict_file = cache[dict_key]['file']
+        else:
+            try:
+                t0 = time.perf_counter_ns()
+                dict_file = _train_zstd_dict(dict_inputs, output_dir)
+                cache[dict_key] = _cache_entry(dict_file, (time.perf_counter_ns() - t0) / 1e9)
+            except zstd.ZstdError:
+                # Too little sample data to train on, compress without a dictionary
+                pass
+        dict_data = _load_zstd_dict(dict_file)
+        dict_id = dict_data.dict_id() if dict_data else 0
+        if dict_data:
+            dict_time = cache[dict_key]['time']
+    
+    keys = {}
+    for input_file in input_files:
+        gpu = input_file in gpu_inputs
+        for algo_name in ALGORITHMS:
+            keys[input_file, algo_name] = _cache_key(
+                algo_name, levels[algo_name], hashes[input_file], dict_id,
+                gpu=gpu and algo_name == 'zstd')
+    output_paths = {pair: os.path.abspath(_output_path(*pair, output_dir)) for pair in keys}
+    
+    # Every output path is written in this run by a job or a copy, except
+    # earlier-run outputs reused in place. A cache entry pointing at a written
+    # path may be overwritten before it is read, so it can't be reused.
+    written = set()
+    for pair, path in output_paths.items():
+        entry = cache.get(keys[pair])
+        if force or not _cache_hit(entry) or entry['file'] != path:
+            written.add(path)
+    
+    # Earlier-run outputs are reused before the pool starts. Every (file,
+    # algorithm) pair with content not seen yet is CPU-bound and independent,
+    # so each one becomes its own job for the process pool.
+    results = {input_file: {} for input_file in input_files}
+    jobs = []
+    job_keys = []
+    queued = set()
+    duplicates = []
+    for (input_file, algo_name), key in keys.items():
+        output_file = output_paths[input_file, algo_name]
+        entry = cache.get(key)
+        if key in queued:
+            duplicates.append((input_file, algo_name))
+        elif (not force and _cache_hit(entry)
+                and (entry['file'] == output_file or entry['file'] not in written)):
+            if entry['file'] != output_file:
+                shutil.copyfile(entry['file'], output_file)
+            results[input_file][algo_name] = _cached_result(
+                _output_path(input_file, algo_name, output_dir), entry['time'])
+        else:
+            cache.pop(key, None)
+            job_dict = None if input_file in gpu_inputs else dict_file
+            jobs.append((input_file, algo_name, levels[algo_name], output_dir, job_dict))
+            job_keys.append(key)
+            queued.add(key)
+    
+    job_results = {}
+    jobs_left = Counter(input_file for input_file, *_ in jobs)
+    # Every output was reused, so there's nothing to start a pool for
+    if jobs:
+        # Split the cores between the pool workers and each worker's zstd threads
+        cpu_count = os.cpu_count() or 1
+        workers = max(1, min(cpu_count, len(jobs)))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(max(1, cpu_count // workers),)) as executor:
+            for (input_file, algo_name, *_), key, result in zip(
+                    jobs, job_keys, executor.map(_run_one_star, jobs)):
+                results[input_file][algo_name] = result
+                job_results[key] = result
+                if result['success']:
+                    # A failed GPU job falls back to the CPU without a dictionary,
+                    # which needs the CPU key
+                    cache_key = key
+                    if key.startswith('zstd-gpu:') and result['backend'] == 'cpu':
+                        cache_key = _cache_key(algo_name, levels[algo_name],
+                                               hashes[input_file])
+                    cache[cache_key] = _cache_entry(result['file'], result['time'])
             
-            compressed_size = get_file_size(output_file)
-            results[algo_name] = {
-                'success': True,
-                'file': str(output_file),
-                'size': compressed_size,
-                'time': compression_time
-            }
-        except ImportError:
-            results[algo_name] = {
-                'success': False,
-                'error': 'Library not installed'
-            }
-        except Exception as e:
-            results[algo_name] = {
-                'success': False,
-                'error': str(e)
-            }
+                # Results arrive in job order, so once the last job for an input
+                # is back no other worker is still reading it
+                jobs_left[input_file] -= 1
+                if jobs_left[input_file] == 0:
+                    _drop_cache(input_file)
+    
+    # Same content, algorithm and level always compress to the same bytes
+    for input_file, algo_name in duplicates:
+        job_result = job_results[keys[input_file, algo_name]]
+        if not job_result['success']:
+            results[input_file][algo_name] = job_result
+            continue
+        output_file = _output_path(input_file, algo_name, output_dir)
+        shutil.copyfile(job_result['file'], output_file)
+        results[input_file][algo_name] = _cached_result(output_file, job_result['time'])
+    
+    # Every zstd output made with the dictionary records what training it cost
+    if dict_id:
+        for input_file in dict_inputs:
+            result = results[input_file]['zstd']
+            if result['success']:
+                result['dict_time'] = dict_time
     
+    _save_cache(cache_file, cache)
     return results
 
+def compress_file(input_file, output_dir=".venv", levels=None, force=False):
+    """Compress a single file using all available algorithms"""
+    return compress_files([input_file], output_dir, levels, force=force)[input_file]
+
 def get_file_size(filepath):
     """Get file size in bytes"""
     try:
@@ -113,21 +614,34 @@ def get_file_size(filepath):
     except:
         return 0
 
+BYTE_UNITS = ('B', 'KB', 'MB', 'GB', 'TB')
+
 def format_bytes(bytes_size):
     """Convert bytes to human readable format"""
-    for unit in ['B', 'KB', 'MB', 'GB']:
-        if bytes_size < 1024.0:
-            return f"{bytes_size:.2f} {unit}"
-        bytes_size /= 1024.0
-    return f"{bytes_size:.2f} TB"
+    # Each unit is 2**10 of the previous one, so bit_length picks it directly
+    k = 0
+    if bytes_size >= 1:
+        k = min((int(bytes_size).bit_length() - 1) // 10, len(BYTE_UNITS) - 1)
+    return f"{bytes_size / (1 << (10 * k)):.2f} {BYTE_UNITS[k]}"
+
+def peak_worker_memory(all_results):
+    """Peak RSS in bytes of the largest pool worker, or None if no job reported one"""
+    peaks = [result['peak_memory'] for results in all_results.values()
+             for result in results.values() if result.get('peak_memory')]
+    return max(peaks, default=None)
 
 def main():
+    parser = argparse.ArgumentParser(description="Multi-algorithm compression research")
+    parser.add_argument('--force', action='store_true',
+                        help="recompress even when an up-to-date output already exists")
+    args = parser.parse_args()
+    
     # Files to compress
     files_to_compress = ['GameAsset.txt', 'LargeDataset.txt', 'sample_files.txt']
     
     print("=" * 70)
     print("MULTI-ALGORITHM COMPRESSION RESEARCH")
-    print("Algorithms: gzip, bzip2, xz, zstd, lz4")
+    print(f"Algorithms: {', '.join(ALGORITHMS)}")
     print("Output directory: .venv/")
     print("=" * 70)
     
@@ -136,46 +650,52 @@ def main():
     start_memory = process.memory_info().rss
     
     # Start timing
-    start_time = time.time()
+    t0 = time.perf_counter_ns()
     
     all_results = {}
     total_original_size = 0
+    original_sizes = {}
     
     for filename in files_to_compress:
-        print(f"\nProcessing: {filename}")
-        print("-" * 50)
-        
-        # Check if file exists
-        if not Path(filename).exists():
-            print(f"File not found: {filename}")
+        # One stat call both checks the file exists and gets its size
+        try:
+            file_stat = os.stat(filename)
+        except FileNotFoundError:
+            print(f"\nFile not found: {filename}")
             continue
         
-        # Get original file size
-        original_size = get_file_size(filename)
-        total_original_size += original_size
-        
+        original_sizes[filename] = file_stat.st_size
+        total_original_size += file_stat.st_size
+    
+    # Compress all files with all algorithms at once
+    if original_sizes:
+        all_results = compress_files(list(original_sizes), force=args.force)
+    
+    for filename, results in all_results.items():
+        original_size = original_sizes[filename]
+        print(f"\nProcessing: {filename}")
+        print("-" * 50)
         print(f"Original size: {format_bytes(original_size)}")
         print()
         
-        # Compress the file with all algorithms
-        results = compress_file(filename)
-        all_results[filename] = results
-        
         # Display results for each algorithm
-        for algo_name in ['gzip', 'bzip2', 'xz', 'zstd', 'lz4']:
+        for algo_name in ALGORITHMS:
             result = results[algo_name]
             if result['success']:
                 compressed_size = result['size']
                 compression_ratio = (1 - compressed_size / original_size) * 100 if original_size > 0 else 0
                 
+                timing = f"{result['time']:.3f}s"
+                if result.get('cached'):
+                    timing += ", cached"
                 print(f"{algo_name:>6}: {format_bytes(compressed_size):>10} "
                       f"({compression_ratio:5.1f}% saved) "
-                      f"[{result['time']:.3f}s]")
+                      f"[{timing}]")
             else:
                 print(f"{algo_name:>6}: {result['error']}")
     
     # End timing and memory measurement
-    end_time = time.time()
+    total_time = (time.perf_counter_ns() - t0) / 1e9
     end_memory = process.memory_info().rss
     
     # Summary
@@ -185,31 +705,45 @@ def main():
     
     if all_results:
         # Calculate best compression ratios
-        algorithm_totals = {}
+        algorithm_totals = defaultdict(lambda: {'total_original': 0, 'total_compressed': 0, 'total_time': 0,
+                                                'cached': 0, 'dict_time': 0})
         for filename, results in all_results.items():
-            original_size = get_file_size(filename)
+            # Sizes were stat'ed once up front, don't stat again per algorithm
+            original_size = original_sizes[filename]
             for algo_name, result in results.items():
                 if result['success']:
-                    if algo_name not in algorithm_totals:
-                        algorithm_totals[algo_name] = {'total_original': 0, 'total_compressed': 0, 'total_time': 0}
                     algorithm_totals[algo_name]['total_original'] += original_size
                     algorithm_totals[algo_name]['total_compressed'] += result['size']
                     algorithm_totals[algo_name]['total_time'] += result['time']
+                    algorithm_totals[algo_name]['cached'] += bool(result.get('cached'))
+                    # One dictionary is shared by every file, so count its training once
+                    algorithm_totals[algo_name]['dict_time'] = max(
+                        algorithm_totals[algo_name]['dict_time'], result.get('dict_time', 0))
         
         print("Algorithm Performance Summary:")
         print("-" * 50)
-        for algo_name in ['gzip', 'bzip2', 'xz', 'zstd', 'lz4']:
+        for algo_name in ALGORITHMS:
             if algo_name in algorithm_totals:
                 data = algorithm_totals[algo_name]
                 ratio = (1 - data['total_compressed'] / data['total_original']) * 100
-                print(f"{algo_name:>6}: {ratio:5.1f}% compression, {data['total_time']:.3f}s total")
+                notes = []
+                if data['cached']:
+                    notes.append(f"{data['cached']} cached")
+                if data['dict_time']:
+                    notes.append(f"incl. {data['dict_time']:.3f}s dictionary training")
+                notes = f" ({', '.join(notes)})" if notes else ""
+                algo_time = data['total_time'] + data['dict_time']
+                print(f"{algo_name:>6}: {ratio:5.1f}% compression, {algo_time:.3f}s total{notes}")
             else:
                 print(f"{algo_name:>6}: Not available")
     
     print(f"\nFiles processed:     {len(files_to_compress)}")
     print(f"Total original size: {format_bytes(total_original_size)}")
-    print(f"Total time taken:    {end_time - start_time:.3f} seconds")
-    print(f"Memory used:         {format_bytes(abs(end_memory - start_memory))}")
+    print(f"Total time taken:    {total_time:.3f} seconds")
+    print(f"Memory used:         {format_bytes(abs(end_memory - start_memory))} (driver process)")
+    worker_memory = peak_worker_memory(all_results)
+    if worker_memory is not None:
+        print(f"Peak worker memory:  {format_bytes(worker_memory)}")
     print(f"Compressed files:    Saved to .venv/ directory")
     print("=" * 70)
 